@@ -17,24 +17,43 @@
 # You should have received a copy of the GNU General Public License
 # along with OpenReset.  If not, see <https://www.gnu.org/licenses/>.
 
-import time
+from hashlib import sha256
+
+DEBUG = False  # Print progress messages, not just errors
+LIGHT_SLEEP = False  # Light sleep while idle; drops USB, so battery use only
 
 LED_BLINK_TIME_MS = 250
+LED_ERROR_PAUSE_MS = 1000  # Pause between repeats of error blinks
+CARD_WAIT_SLEEP_MS = 1000  # Max light sleep per card check, IRQ wakes sooner
 WRITE_WAIT_TIMEOUT_MS = 1200  # Datasheet says block erase takes max 1s, add margin
+SPI_BAUDRATE = 20_000_000  # Lower this if wiring to the card is long or noisy
 
 ERR_OK = 0
 ERR_WRONG_CARD = 1
 ERR_WRONG_FLASH_ID = 2
 ERR_TIMEOUT = 3
 
-def wait_write_complete(flash, timeout_ms):
-    start_time = time.ticks_ms()
-    # Wait while WIP and WEL bits are set
-    while (flash.rdsr() & 0x03) != 0:
-        curr_time = time.ticks_ms()
-        if time.ticks_diff(curr_time, start_time) > timeout_ms:
-            # Timeout exceeded
-            return False
+CARD_ID_ADDR = 0x10
+CARD_ID_SIZE = 0x22
+
+def read_card_id(flash, id_cache, size):
+    """
+    Return the first size bytes of the card ID area. The area is only read
+    from flash once per card; clear id_cache when the card is removed.
+    """
+    id_data = id_cache.get('id_data')
+    if id_data is None:
+        id_data = flash.read(CARD_ID_ADDR, CARD_ID_SIZE)
+        id_cache['id_data'] = id_data
+    return id_data[:size]
 
-    # Completed within timeout
-    return True
+def read_card_id_hash(flash, id_cache, size):
+    """
+    Return the SHA-256 digest of the first size bytes of the card ID area.
+    The digest is cached in id_cache alongside the ID data.
+    """
+    id_hash = id_cache.get(size)
+    if id_hash is None:
+        id_hash = sha256(read_card_id(flash, id_cache, size)).digest()
+        id_cache[size] = id_hash
+    return id_hash
@@ -21,7 +21,7 @@ import machine
 import time
 import common
 
-from resetters import *
+from resetters import RESETTERS
 
 # Hardware definitions ========================================================
 
@@ -31,6 +31,9 @@ led_red = machine.Pin(4, machine.Pin.OUT)
 
 # Card detect
 card_detect = machine.Pin(20, machine.Pin.IN, machine.Pin.PULL_UP)
+if common.LIGHT_SLEEP:
+    # Interrupt on insertion only serves to wake from light sleep
+    card_detect.irq(trigger=machine.Pin.IRQ_FALLING, handler=lambda pin: None)
 
 # SPI
 spi_sck = machine.Pin(18)
@@ -38,18 +41,32 @@ spi_mosi = machine.Pin(19)
 spi_miso = machine.Pin(16)
 spi_cs = machine.Pin(17, machine.Pin.OUT)
 
-spi = machine.SPI(0, baudrate=2_000_000, sck=spi_sck, mosi=spi_mosi,
-                  miso=spi_miso)
-
-resetters = [DimResetter, TamaSmaCardResetter, PreDataMemoryResetter]
-
-def blink_err(times):
-    # Blink off
-    for _ in range(times):
-        led_red.value(0)
-        time.sleep_ms(common.LED_BLINK_TIME_MS)
-        led_red.value(1)
-        time.sleep_ms(common.LED_BLINK_TIME_MS)
+spi = machine.SPI(0, baudrate=common.SPI_BAUDRATE, sck=spi_sck,
+                  mosi=spi_mosi, miso=spi_miso)
+
+# Card ID data, read once per inserted card
+id_cache = {}
+
+def blink_err_until_removed(times):
+    # Blink off the given number of times and pause, repeating until card is
+    # removed. LED is toggled on deadlines so card detect is polled throughout.
+    step = 0
+    next_time = time.ticks_ms()
+    while card_detect.value() == 0:
+        now = time.ticks_ms()
+        if time.ticks_diff(now, next_time) >= 0:
+            # Even steps turn LED off, odd steps turn it back on
+            led_red.value(step & 1)
+            step += 1
+            delay = common.LED_BLINK_TIME_MS
+            if step == times * 2:
+                step = 0
+                delay += common.LED_ERROR_PAUSE_MS
+            next_time = time.ticks_add(now, delay)
+        time.sleep_ms(10)
+
+    # Restore power indicator in case card was removed mid-blink
+    led_red.value(1)
 
 # Main loop ===================================================================
 
@@ -60,23 +77,30 @@ led_green.value(0)
 while True:
     # Wait until card is inserted (reads low)
     while card_detect.value() != 0:
-        time.sleep_ms(50)
+        if common.LIGHT_SLEEP:
+            machine.lightsleep(common.CARD_WAIT_SLEEP_MS)
+        else:
+            time.sleep_ms(50)
 
     # Light LED to indicate we are running
     led_green.value(1)
-    print('Card inserted')
+    if common.DEBUG:
+        print('Card inserted')
     # Wait a bit in case card is still being inserted
     time.sleep_ms(200)
 
     ret = common.ERR_WRONG_CARD
 
     # Iterate the resetters, and if detect OK, perform reset
-    for resetter in resetters:
-        print('Checking for {}'.format(resetter.__name__))
-        ret = resetter.detect(spi, spi_cs)
+    for resetter in RESETTERS:
+        if common.DEBUG:
+            print('Checking for {}'.format(resetter.__name__))
+        flash = resetter.DRIVER(spi, spi_cs)
+        ret = resetter.detect(flash, id_cache)
         if ret == common.ERR_OK:
-            print('Detected by {}'.format(resetter.__name__))
-            resetter_inst = resetter(spi, spi_cs)
+            if common.DEBUG:
+                print('Detected by {}'.format(resetter.__name__))
+            resetter_inst = resetter(flash)
             ret = resetter_inst.do_reset()
             break
 
@@ -88,11 +112,11 @@ while True:
 
     if ret != common.ERR_OK:
         # Blink error until card removed
-        while card_detect.value() == 0:
-            blink_err(ret)
-            time.sleep_ms(1000)
+        blink_err_until_removed(ret)
     else:
         # Wait until card is removed (reads high)
         while card_detect.value() == 0:
             time.sleep_ms(50)
-    print('Card removed')
+    id_cache.clear()
+    if common.DEBUG:
+        print('Card removed')
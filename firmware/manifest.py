@@ -0,0 +1,14 @@
+# MicroPython manifest for freezing the OpenReset modules into firmware.
+#
+# Build from a MicroPython checkout with:
+#   make -C ports/rp2 BOARD=RPI_PICO FROZEN_MANIFEST=/path/to/firmware/manifest.py
+#
+# main.py is not frozen, so it can still be edited without rebuilding the
+# firmware. Upload it separately.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("common.py")
+module("md5.py")
+module("resetters.py")
+module("spi_flash.py")
@@ -34,6 +34,8 @@ constants = [3614090360, 3905402710, 606105819, 3250441966, 4118548399, 12000804
 
 init_values = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476]
 
+padding = b'\x80' + bytes(63)
+
 functions = 16*[lambda b, c, d: (b & c) | (~b & d)] + \
     16*[lambda b, c, d: (d & b) | (~d & c)] + \
             16*[lambda b, c, d: b ^ c ^ d] + \
@@ -51,9 +53,7 @@ def left_rotate(x, amount):
 def md5(message):
     message = bytearray(message) #copy our input into a mutable buffer
     orig_len_in_bits = (8 * len(message)) & 0xffffffffffffffff
-    message.append(0x80)
-    while len(message)%64 != 56:
-        message.append(0)
+    message += padding[:(55 - len(message))%64 + 1]
     message += orig_len_in_bits.to_bytes(8, 'little')
     #print (message)
 
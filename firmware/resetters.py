@@ -17,23 +17,28 @@
 # You should have received a copy of the GNU General Public License
 # along with OpenReset.  If not, see <https://www.gnu.org/licenses/>.
 
-from hashlib import sha256
 from binascii import hexlify
 
 from md5 import md5
 from spi_flash import SPIFlashDriver, MX25LDriver
 import common
 
+# Shared all-zero page for clearing flash
+_ZEROS = bytes(0x100)
+_ZEROS_MV = memoryview(_ZEROS)
+
 class DimResetter:
     ID_HASH = b'\xb2\xdc\xb5\x07\x7c\x68\xd2\xd5\x40\xde\x10\x45\x9a\x06\x18\x23\x2a\x21\x17\xd3\x48\xac\x10\xf2\x89\x8f\xb1\x5c\x61\x46\x84\x82'
     FLASH_ID = b'\xc2\x20\x16'  # MX25L3233F
+    DRIVER = MX25LDriver
     ERASE_ADDRS = [0x10000, 0x90000, 0xa0000]
 
-    def __init__(self, spi, cs) -> None:
-        self.flash = MX25LDriver(spi, cs)
+    def __init__(self, flash) -> None:
+        self.flash = flash
 
     def do_reset(self):
-        print('Starting process')
+        if common.DEBUG:
+            print('Starting process')
 
         # Remove block protection
         sr = self.flash.rdsr()
@@ -42,7 +47,7 @@ class DimResetter:
         sr &= 0x40  # Retain QE, ignore WEL and WIP, unset all other bits
         self.flash.wren()
         self.flash.wrsr(sr, cr)
-        if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+        if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
             print('Write timeout when removing write protection')
             return common.ERR_TIMEOUT
 
@@ -50,7 +55,7 @@ class DimResetter:
         for addr in self.ERASE_ADDRS:
             self.flash.wren()
             self.flash.be(addr)
-            if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+            if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
                 print('Write timeout while erasing block address 0x{:06x}'.format(addr))
                 return common.ERR_TIMEOUT
 
@@ -61,24 +66,21 @@ class DimResetter:
         sr |= 0x3c
         self.flash.wren()
         self.flash.wrsr(sr, cr)
-        if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+        if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
             print('Write timeout when setting write protection')
             # Not critical, so we won't return an error
 
         # Done!
-        print('Process complete')
+        if common.DEBUG:
+            print('Process complete')
         return common.ERR_OK
 
     @classmethod
-    def detect(cls, spi, cs):
+    def detect(cls, flash, id_cache):
         # Read and verify this is the correct type of card
-        flash = MX25LDriver(spi, cs)
-        id_data = flash.read(0x10, 0x22)
-        hasher = sha256(id_data)
-        hash_bytes = hasher.digest()
-        if hash_bytes != cls.ID_HASH:
+        if common.read_card_id_hash(flash, id_cache, 0x22) != cls.ID_HASH:
             # print('Card type check failed. Read data:')
-            # print(hexlify(id_data))
+            # print(hexlify(common.read_card_id(flash, id_cache, 0x22)))
             return common.ERR_WRONG_CARD
 
         # Check flash ID
@@ -93,60 +95,63 @@ class DimResetter:
 
 class TamaSmaCardResetter:
     ID_HASH = b'\x12\xef\xbb\x0a\xd7\x93\xd7\xd0\xd2\x16\xda\xdb\x30\x14\x66\xa2\xc3\xd0\xb1\xb1\x77\x7c\xcd\x9b\xfe\x4d\x29\xd2\xc7\x7a\x7f\xba'
+    DRIVER = SPIFlashDriver
 
-    def __init__(self, spi, cs) -> None:
-        self.flash = SPIFlashDriver(spi, cs)
+    def __init__(self, flash) -> None:
+        self.flash = flash
 
     def do_reset(self):
-        print('Starting process')
+        if common.DEBUG:
+            print('Starting process')
 
         # Read header
-        header = bytearray(self.flash.read(0x0, 0x100))
+        header = self.flash.read(0x0, 0x100)
+        header_mv = memoryview(header)
+        # Verify header was read intact before we erase the only copy
+        hash = md5(header_mv[0x00:0x40])
+        if hash.to_bytes(16, 'little') != header[0x40:0x50]:
+            print('Header checksum mismatch, not erasing')
+            return common.ERR_TIMEOUT
         # Clear locks
-        header[0x04:0x10] = b'\0' * 12
+        header_mv[0x04:0x10] = _ZEROS_MV[:12]
         # Recalculate checksum
-        hash = md5(header[0x00:0x40])
-        header[0x40:0x50] = hash.to_bytes(16, 'little')
+        hash = md5(header_mv[0x00:0x40])
+        header_mv[0x40:0x50] = hash.to_bytes(16, 'little')
         # Clear rest of the page with zeroes
-        header[0x50:0x100] = b'\0' * 0xb0
+        header_mv[0x50:0x100] = _ZEROS_MV[:0xb0]
 
         # Erase sector
         self.flash.wren()
         self.flash.se(0x0)
-        if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+        if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
             print('Write timeout while erasing header sector')
             return common.ERR_TIMEOUT
 
         # Program header page
-        self.flash.wren()
-        self.flash.pp(0x0, header)
-        if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+        self.flash.wren_and_pp(0x0, header)
+        if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
             print('Write timeout while programming header')
             return common.ERR_TIMEOUT
 
-        # Clear entire page with zeroes and program to rest of sector
-        header = bytearray(0x100)
+        # Program zeroed pages to rest of sector. These must be written
+        # rather than left erased, as the card expects zeroes, not 0xff.
         for i in range(0x100, 0x1000, 0x100):
-            self.flash.wren()
-            self.flash.pp(i, header)
-            if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+            self.flash.wren_and_pp(i, _ZEROS)
+            if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
                 print('Write timeout while programming page 0x{:06x}'.format(i))
                 return common.ERR_TIMEOUT
 
         # Done!
-        print('Process complete')
+        if common.DEBUG:
+            print('Process complete')
         return common.ERR_OK
 
     @classmethod
-    def detect(cls, spi, cs):
+    def detect(cls, flash, id_cache):
         # Read and verify this is the correct type of card
-        flash = SPIFlashDriver(spi, cs)
-        id_data = flash.read(0x10, 0x22)
-        hasher = sha256(id_data)
-        hash_bytes = hasher.digest()
-        if hash_bytes != cls.ID_HASH:
+        if common.read_card_id_hash(flash, id_cache, 0x22) != cls.ID_HASH:
             # print('Card type check failed. Read data:')
-            # print(hexlify(id_data))
+            # print(hexlify(common.read_card_id(flash, id_cache, 0x22)))
             return common.ERR_WRONG_CARD
 
         return common.ERR_OK
@@ -155,37 +160,33 @@ class TamaSmaCardResetter:
 class PreDataMemoryResetter:
     ID_HASH = b'\xda\x15\x3a\x43\x7d\x99\xe0\x78\x91\xfc\xc7\x73\x46\xd6\x7a\x0c\xde\x9c\x75\xa1\x44\x80\x28\x37\x01\xc8\xe2\x8b\x51\xa6\x0b\x74'
     FLASH_ID = b'\xc8\x40\x14'  # GD25Q80E
-    ERASE_ADDRS = [0xfd000, 0xfe000, 0xff000]
+    DRIVER = SPIFlashDriver
 
-    def __init__(self, spi, cs) -> None:
-        self.flash = SPIFlashDriver(spi, cs)
+    def __init__(self, flash) -> None:
+        self.flash = flash
 
     def do_reset(self):
-        print('Starting process')
+        if common.DEBUG:
+            print('Starting process')
 
         # Clear lock sectors with zeroes
-        zeros = bytearray(0x100)
         for i in range(0xfd000, 0x100000, 0x100):
-            self.flash.wren()
-            self.flash.pp(i, zeros)
-            if not common.wait_write_complete(self.flash, common.WRITE_WAIT_TIMEOUT_MS):
+            self.flash.wren_and_pp(i, _ZEROS)
+            if not self.flash.wait_ready(common.WRITE_WAIT_TIMEOUT_MS):
                 print('Write timeout while programming page 0x{:06x}'.format(i))
                 return common.ERR_TIMEOUT
 
         # Done!
-        print('Process complete')
+        if common.DEBUG:
+            print('Process complete')
         return common.ERR_OK
 
     @classmethod
-    def detect(cls, spi, cs):
+    def detect(cls, flash, id_cache):
         # Read and verify this is the correct type of card
-        flash = SPIFlashDriver(spi, cs)
-        id_data = flash.read(0x10, 0x20)
-        hasher = sha256(id_data)
-        hash_bytes = hasher.digest()
-        if hash_bytes != cls.ID_HASH:
+        if common.read_card_id_hash(flash, id_cache, 0x20) != cls.ID_HASH:
             # print('Card type check failed. Read data:')
-            # print(hexlify(id_data))
+            # print(hexlify(common.read_card_id(flash, id_cache, 0x20)))
             return common.ERR_WRONG_CARD
 
         # Check flash ID
@@ -196,3 +197,7 @@ class PreDataMemoryResetter:
             return common.ERR_WRONG_FLASH_ID
 
         return common.ERR_OK
+
+
+# Resetters in the order they are tried when a card is inserted
+RESETTERS = [DimResetter, TamaSmaCardResetter, PreDataMemoryResetter]
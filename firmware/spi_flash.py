@@ -17,6 +17,30 @@
 # You should have received a copy of the GNU General Public License
 # along with OpenReset.  If not, see <https://www.gnu.org/licenses/>.
 
+import micropython
+import struct
+import time
+
+# Scratch buffers shared by all drivers, so commands don't allocate
+_CMD = bytearray(5)  # Opcode, 24-bit address, dummy byte
+_CMD_MV = memoryview(_CMD)
+_PP_BUF = bytearray(4 + 0x100)  # Page program command + one page of data
+_PP_MV = memoryview(_PP_BUF)
+_STATUS = bytearray(1)
+
+def _set_addr_cmd(buf, opcode, addr):
+    # Opcode followed by big endian 24-bit address. Pack the address as a
+    # 32-bit word and overwrite its top byte, keeping values small ints.
+    struct.pack_into('>I', buf, 0, addr & 0xffffff)
+    buf[0] = opcode
+
+def _fill_pp(addr, data):
+    # Fill page program buffer and return the part to send
+    end = 4 + len(data)
+    _set_addr_cmd(_PP_BUF, 0x02, addr)
+    _PP_MV[4:end] = data
+    return _PP_MV[:end]
+
 class SPIFlashDriver:
     """
     Base SPI NOR flash driver, can be used as a generic driver.
@@ -41,6 +65,32 @@ class SPIFlashDriver:
         self.cs.value(1)
         return resp
 
+    @micropython.native
+    def wait_ready(self, timeout_ms):
+        """
+        Wait for write to complete. Returns False if timeout exceeded.
+        """
+        buf = _STATUS
+        readinto = self.spi.readinto
+        ticks_ms = time.ticks_ms
+        ticks_diff = time.ticks_diff
+        deadline = time.ticks_add(ticks_ms(), timeout_ms)
+        # Hold CS and keep reading status register until WIP and WEL clear
+        self.cs.value(0)
+        self.spi.write(b'\x05')
+        while True:
+            readinto(buf)
+            if (buf[0] & 0x03) == 0:
+                break
+            if ticks_diff(ticks_ms(), deadline) > 0:
+                # Timeout exceeded
+                self.cs.value(1)
+                return False
+        self.cs.value(1)
+
+        # Completed within timeout
+        return True
+
     def wren(self):
         """Set write enable latch."""
         self.cs.value(0)
@@ -48,34 +98,46 @@ class SPIFlashDriver:
         self.cs.value(1)
 
     def read(self, addr, count):
-        """Read and return bytes from flash array."""
+        """Read and return bytes from flash array (uses fast read)."""
+        _set_addr_cmd(_CMD, 0x0b, addr)  # Dummy byte stays zero
+        resp = bytearray(count)
         self.cs.value(0)
-        self.spi.write(bytes([0x03, (addr >> 16) & 0xff, (addr >> 8) & 0xff,
-                              addr & 0xff]))
-        resp = self.spi.read(count)
+        self.spi.write(_CMD)
+        self.spi.readinto(resp)
         self.cs.value(1)
         return resp
 
     def pp(self, addr, data):
         """Program a page."""
+        cmd = _fill_pp(addr, data)
         self.cs.value(0)
-        self.spi.write(bytes([0x02, (addr >> 16) & 0xff, (addr >> 8) & 0xff,
-                              addr & 0xff]))
-        self.spi.write(data)
+        self.spi.write(cmd)
         self.cs.value(1)
 
+    def wren_and_pp(self, addr, data):
+        """Set write enable latch and program a page."""
+        cmd = _fill_pp(addr, data)
+        cs = self.cs
+        write = self.spi.write
+        cs.value(0)
+        write(b'\x06')
+        cs.value(1)
+        cs.value(0)
+        write(cmd)
+        cs.value(1)
+
     def be(self, addr):
         """Erase 64KB block."""
+        _set_addr_cmd(_CMD, 0xd8, addr)
         self.cs.value(0)
-        self.spi.write(bytes([0xd8, (addr >> 16) & 0xff, (addr >> 8) & 0xff,
-                              addr & 0xff]))
+        self.spi.write(_CMD_MV[:4])
         self.cs.value(1)
 
     def se(self, addr):
         """Erase 4KB sector."""
+        _set_addr_cmd(_CMD, 0x20, addr)
         self.cs.value(0)
-        self.spi.write(bytes([0x20, (addr >> 16) & 0xff, (addr >> 8) & 0xff,
-                              addr & 0xff]))
+        self.spi.write(_CMD_MV[:4])
         self.cs.value(1)
 
 